@@ -6,11 +6,17 @@ module, including API interactions, file operations, and data processing logic.
 """
 
 import json
+import sqlite3
 import time
-from unittest.mock import MagicMock
+from contextlib import closing
 
 import pytest
+import responses
 import user_engagement_metrics
+from responses import matchers
+
+API = user_engagement_metrics.GITHUB_API
+URL = f"{API}/rate_limited"
 
 
 @pytest.fixture(autouse=True)
@@ -35,155 +41,405 @@ def patch_globals(tmp_path, monkeypatch):
     monkeypatch.setattr(
         user_engagement_metrics,
         "CHECKPOINT_FILE",
+        str(tmp_path / "completed_usernames.sqlite"),
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics,
+        "LEGACY_CHECKPOINT_FILE",
         str(tmp_path / "completed_usernames.txt"),
     )
+    monkeypatch.setattr(
+        user_engagement_metrics, "ETAG_CACHE_FILE", str(tmp_path / "etag_cache.sqlite")
+    )
+    user_engagement_metrics.get_user_profile.cache_clear()
+    user_engagement_metrics.get_orgs.cache_clear()
     yield
+    user_engagement_metrics.close_files()
+    user_engagement_metrics.close_etag_cache()
 
 
-def test_safe_get_rate_limit(monkeypatch):
+@pytest.fixture(name="sleeps")
+def fixture_sleeps(monkeypatch):
+    """
+    Fixture that records calls to time.sleep instead of sleeping.
+
+    Args:
+        monkeypatch: pytest fixture for modifying objects
+
+    Returns:
+        list: The durations passed to time.sleep, in call order
+    """
+    recorded = []
+    monkeypatch.setattr(user_engagement_metrics.time, "sleep", recorded.append)
+    return recorded
+
+
+@responses.activate
+def test_safe_get_rate_limit(sleeps):
     """
     Test that safe_get handles GitHub API rate limits correctly.
 
     This test verifies that when a rate limit response is received,
-    the function waits and retries the request.
+    the function waits until the reset time and retries the request.
     """
-    m_resp = MagicMock()
-    m_resp.status_code = 403
-    m_resp.headers = {
-        "X-RateLimit-Remaining": "0",
-        "X-RateLimit-Reset": str(int(time.time()) + 1),
-    }
-    m_resp.json.return_value = {}
-
-    call_count = {"count": 0}
-
-    def fake_requests_get(*_a, **_kw):
-        """Fake requests.get to simulate rate limiting."""
-        call_count["count"] += 1
-        # simulate second call as success
-        if call_count["count"] > 1:
-            resp = MagicMock()
-            resp.status_code = 200
-            resp.json.return_value = {"ok": True}
-            resp.headers = {}
-            return resp
-        return m_resp
-
-    monkeypatch.setattr(user_engagement_metrics.requests, "get", fake_requests_get)
-    resp = user_engagement_metrics.safe_get("url")
+    responses.get(
+        URL,
+        status=403,
+        headers={
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(int(time.time()) + 1),
+        },
+    )
+    responses.get(URL, json={"ok": True})
+    resp = user_engagement_metrics.safe_get(URL)
     assert resp.json() == {"ok": True}
-    assert call_count["count"] == 2
+    assert len(responses.calls) == 2
+    assert len(sleeps) == 1 and 2 <= sleeps[0] <= 4
 
 
-def test_get_user_profile(monkeypatch):
+@responses.activate
+def test_safe_get_rate_limit_reset_too_far(sleeps):
     """
-    Test that get_user_profile correctly calls the GitHub API and processes the result.
+    Test that safe_get raises RateLimitExceeded instead of sleeping past MAX_RATE_LIMIT_SLEEP.
     """
-    monkeypatch.setattr(
-        user_engagement_metrics,
-        "safe_get",
-        lambda url: MagicMock(json=lambda: {"login": "foo"}),
+    responses.get(
+        URL,
+        status=403,
+        headers={
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(int(time.time()) + 24 * 60 * 60),
+        },
     )
-    assert user_engagement_metrics.get_user_profile("foo") == {"login": "foo"}
+    with pytest.raises(user_engagement_metrics.RateLimitExceeded):
+        user_engagement_metrics.safe_get(URL)
+    assert not sleeps
 
 
-def test_get_user_repos(monkeypatch):
+@responses.activate
+def test_safe_get_retry_after(sleeps):
     """
-    Test that get_user_repos correctly handles API pagination.
+    Test that safe_get waits for Retry-After on secondary rate limits and then retries.
+    """
+    responses.get(URL, status=403, headers={"Retry-After": "30"})
+    responses.get(URL, json={"ok": True})
+    assert user_engagement_metrics.safe_get(URL).json() == {"ok": True}
+    assert len(sleeps) == 1 and 31 <= sleeps[0] <= 32
+
+
+@responses.activate
+def test_safe_get_retry_after_counts_retries(sleeps):
+    """
+    Test that safe_get gives up after max_retries when Retry-After keeps being returned.
+    """
+    responses.get(URL, status=429, headers={"Retry-After": "5"})
+    resp = user_engagement_metrics.safe_get(URL, max_retries=2)
+    assert resp.status_code == 429
+    assert len(responses.calls) == 3
+    assert len(sleeps) == 2
+
+
+@responses.activate
+def test_safe_get_retry_after_http_date(sleeps):
+    """
+    Test that safe_get falls back to exponential backoff when Retry-After is not numeric.
+    """
+    responses.get(
+        URL, status=403, headers={"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}
+    )
+    responses.get(URL, json={"ok": True})
+    assert user_engagement_metrics.safe_get(URL).json() == {"ok": True}
+    assert len(sleeps) == 1 and 1 <= sleeps[0] <= 2
+
+
+@responses.activate
+def test_safe_get_retry_after_too_long(sleeps):
+    """
+    Test that safe_get raises RateLimitExceeded when Retry-After exceeds MAX_RATE_LIMIT_SLEEP.
+    """
+    responses.get(URL, status=403, headers={"Retry-After": str(24 * 60 * 60)})
+    with pytest.raises(user_engagement_metrics.RateLimitExceeded):
+        user_engagement_metrics.safe_get(URL)
+    assert not sleeps
+
+
+@responses.activate
+def test_safe_get_server_error_retries(sleeps):
+    """
+    Test that safe_get backs off exponentially on server errors and gives up after max_retries.
+    """
+    responses.get(URL, status=502)
+    resp = user_engagement_metrics.safe_get(URL, max_retries=2)
+    assert resp.status_code == 502
+    assert len(responses.calls) == 3
+    assert len(sleeps) == 2
+
+
+@responses.activate
+def test_safe_get_paces_low_rate_limit(sleeps):
+    """
+    Test that safe_get spreads the remaining budget over the time left when it runs low.
+    """
+    responses.get(
+        URL,
+        json={},
+        headers={
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "10",
+            "X-RateLimit-Reset": str(int(time.time()) + 100),
+            "X-RateLimit-Resource": "core",
+        },
+    )
+    user_engagement_metrics.safe_get(URL)
+    assert len(sleeps) == 1 and 9 <= sleeps[0] <= 10
+
+
+@responses.activate
+def test_safe_get_paces_relative_to_bucket_limit(sleeps):
+    """
+    Test that small buckets like search are only paced when low relative to their own limit.
     """
-    # Simulate 2 pages, then empty
-    responses = [[{"id": 1}, {"id": 2}]]
+    reset = str(int(time.time()) + 60)
+    bucket = {"X-RateLimit-Limit": "30", "X-RateLimit-Resource": "search"}
+    responses.get(
+        URL,
+        json={},
+        headers={**bucket, "X-RateLimit-Remaining": "25", "X-RateLimit-Reset": reset},
+    )
+    responses.get(
+        URL,
+        json={},
+        headers={**bucket, "X-RateLimit-Remaining": "2", "X-RateLimit-Reset": reset},
+    )
+    user_engagement_metrics.safe_get(URL)
+    assert not sleeps
+    user_engagement_metrics.safe_get(URL)
+    assert len(sleeps) == 1 and 29 <= sleeps[0] <= 30
+
+
+@responses.activate
+def test_safe_get_conditional_request():
+    """
+    Test that safe_get revalidates cached responses with If-None-Match and serves 304s from the cache.
+    """
+    link = f'<{URL}?page=2>; rel="last"'
+    responses.get(URL, json={"login": "foo"}, headers={"ETag": '"abc"', "Link": link})
+    responses.get(URL, status=304)
+    user_engagement_metrics.safe_get(URL, use_cache=True)
+    resp = user_engagement_metrics.safe_get(URL, use_cache=True)
+    assert "If-None-Match" not in responses.calls[0].request.headers
+    assert responses.calls[1].request.headers["If-None-Match"] == '"abc"'
+    assert resp.status_code == 200
+    assert resp.json() == {"login": "foo"}
+    assert resp.headers["link"] == link
+
+
+def test_etag_cache_evicts_stale_entries(tmp_path):
+    """
+    Test that cached responses older than ETAG_CACHE_MAX_AGE are evicted when the cache opens.
+    """
+    with closing(sqlite3.connect(tmp_path / "etag_cache.sqlite")) as conn:
+        conn.execute(
+            "CREATE TABLE responses (key TEXT PRIMARY KEY, etag TEXT NOT NULL, "
+            "headers TEXT NOT NULL, body BLOB NOT NULL, last_seen REAL NOT NULL)"
+        )
+        stale = time.time() - user_engagement_metrics.ETAG_CACHE_MAX_AGE - 1
+        conn.executemany(
+            "INSERT INTO responses VALUES (?, ?, '{}', x'', ?)",
+            [("stale", '"a"', stale), ("fresh", '"b"', time.time())],
+        )
+        conn.commit()
+    assert user_engagement_metrics.load_cached_response("stale") is None
+    assert user_engagement_metrics.load_cached_response("fresh") == ('"b"', {}, b"")
+
+
+@responses.activate
+def test_get_user_profile():
+    """
+    Test that get_user_profile calls the GitHub API and keeps only the fields it needs.
+    """
+    responses.get(
+        f"{API}/users/foo",
+        json={"login": "foo", "name": "Foo", "followers": 10},
+    )
+    assert user_engagement_metrics.get_user_profile("foo") == {
+        "name": "Foo",
+        "followers": 10,
+    }
 
-    def safe_get(_url, **kwargs):
-        return MagicMock(json=lambda: responses.pop(0))
 
-    monkeypatch.setattr(user_engagement_metrics, "safe_get", safe_get)
+@responses.activate
+def test_get_user_profile_memoized():
+    """
+    Test that repeated get_user_profile calls for the same user within a run hit the API once.
+    """
+    responses.get(f"{API}/users/foo", json={"name": "Foo"})
+    user_engagement_metrics.get_user_profile("foo")
+    assert user_engagement_metrics.get_user_profile("foo") == {"name": "Foo"}
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_get_user_profile_error_not_memoized():
+    """
+    Test that get_user_profile raises on API errors and retries them on the next call.
+    """
+    responses.get(f"{API}/users/foo", status=401, json={"message": "Bad credentials"})
+    responses.get(f"{API}/users/foo", json={"name": "Foo"})
+    with pytest.raises(ValueError):
+        user_engagement_metrics.get_user_profile("foo")
+    assert user_engagement_metrics.get_user_profile("foo") == {"name": "Foo"}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_get_user_profile_not_found():
+    """
+    Test that get_user_profile returns the Not Found message for missing users.
+    """
+    responses.get(f"{API}/users/ghost", status=404, json={"message": "Not Found"})
+    assert user_engagement_metrics.get_user_profile("ghost") == {"message": "Not Found"}
+
+
+@responses.activate
+def test_get_user_repos():
+    """
+    Test that get_user_repos correctly handles API pagination.
+    """
+    repos_url = f"{API}/users/foo/repos"
+    responses.get(
+        repos_url,
+        json=[{"id": i} for i in range(100)],
+        match=[matchers.query_param_matcher({"per_page": "100", "page": "1"})],
+    )
+    responses.get(
+        repos_url,
+        json=[{"id": 100}],
+        match=[matchers.query_param_matcher({"per_page": "100", "page": "2"})],
+    )
     repos = user_engagement_metrics.get_user_repos("foo")
-    assert repos == [{"id": 1}, {"id": 2}]
+    assert repos == [{"id": i} for i in range(101)]
 
 
-def test_get_starred_repos_count_no_link(monkeypatch):
+@responses.activate
+def test_get_starred_repos_count_no_link():
     """
     Test that get_starred_repos_count works correctly when no pagination Link header is present.
     """
-    m_resp = MagicMock()
-    m_resp.headers = {}
-    m_resp.json.return_value = [1, 2, 3]
-    monkeypatch.setattr(user_engagement_metrics, "safe_get", lambda *a, **k: m_resp)
-    assert user_engagement_metrics.get_starred_repos_count("foo") == 3
+    responses.head(f"{API}/users/foo/starred")
+    responses.get(f"{API}/users/foo/starred", json=[{"id": 1}])
+    assert user_engagement_metrics.get_starred_repos_count("foo") == 1
 
 
-def test_get_starred_repos_count_with_link(monkeypatch):
+@responses.activate
+def test_get_starred_repos_count_with_link():
     """
     Test that get_starred_repos_count correctly parses the Link header for total count.
     """
-    m_resp = MagicMock()
-    m_resp.headers = {
-        "Link": '<https://api.github.com/user/123/starred?page=42>; rel="last"'
-    }
-    m_resp.json.return_value = [1]
-    monkeypatch.setattr(user_engagement_metrics, "safe_get", lambda *a, **k: m_resp)
+    responses.head(
+        f"{API}/users/foo/starred",
+        headers={
+            "Link": '<https://api.github.com/user/123/starred?page=42>; rel="last"'
+        },
+    )
     assert user_engagement_metrics.get_starred_repos_count("foo") == 42
+    assert len(responses.calls) == 1
 
 
-def test_get_orgs(monkeypatch):
+@responses.activate
+def test_get_starred_repos_count_link_param_order():
     """
-    Test that get_orgs correctly processes the API response.
+    Test that get_starred_repos_count reads the page parameter wherever it sits in the last URL.
     """
-    monkeypatch.setattr(
-        user_engagement_metrics,
-        "safe_get",
-        lambda url: MagicMock(json=lambda: [{"login": "acme"}]),
+    responses.head(
+        f"{API}/users/foo/starred",
+        headers={
+            "Link": (
+                f'<{API}/user/123/starred?page=2&per_page=1>; rel="next", '
+                f'<{API}/user/123/starred?page=42&per_page=1>; rel="last"'
+            )
+        },
     )
-    assert user_engagement_metrics.get_orgs("foo") == [{"login": "acme"}]
+    assert user_engagement_metrics.get_starred_repos_count("foo") == 42
+
+
+@responses.activate
+def test_get_orgs():
+    """
+    Test that get_orgs correctly processes the API response.
+    """
+    responses.get(f"{API}/users/foo/orgs", json=[{"login": "acme", "id": 1}])
+    assert user_engagement_metrics.get_orgs("foo") == ["acme"]
 
 
-def test_search_user_contributions_commit(monkeypatch):
+@responses.activate
+def test_get_orgs_error():
+    """
+    Test that get_orgs raises ValueError when the API returns an error payload.
+    """
+    responses.get(f"{API}/users/ghost/orgs", status=404, json={"message": "Not Found"})
+    with pytest.raises(ValueError):
+        user_engagement_metrics.get_orgs("ghost")
+
+
+@responses.activate
+def test_search_user_contributions_commit():
     """
     Test that search_user_contributions correctly handles commit searches.
     """
-    m_resp = MagicMock()
-    m_resp.json.return_value = {"total_count": 123}
-    monkeypatch.setattr(
-        user_engagement_metrics,
-        "safe_get",
-        lambda url, params=None, extra_headers=None: m_resp,
+    responses.get(
+        f"{API}/search/commits",
+        json={"total_count": 123},
+        match=[matchers.query_param_matcher({"q": "author:foo"})],
     )
     assert user_engagement_metrics.search_user_contributions("foo", "commit") == 123
+    assert (
+        responses.calls[0].request.headers["Accept"]
+        == "application/vnd.github.cloak-preview+json"
+    )
 
 
-def test_search_user_contributions_issue(monkeypatch):
+@responses.activate
+def test_search_user_contributions_issue():
     """
     Test that search_user_contributions correctly handles issue searches.
     """
-    m_resp = MagicMock()
-    m_resp.json.return_value = {"total_count": 99}
-    monkeypatch.setattr(
-        user_engagement_metrics,
-        "safe_get",
-        lambda url, params=None, extra_headers=None: m_resp,
+    responses.get(
+        f"{API}/search/issues",
+        json={"total_count": 99},
+        match=[matchers.query_param_matcher({"q": "type:issue author:foo"})],
     )
     assert user_engagement_metrics.search_user_contributions("foo", "issue") == 99
 
 
-def test_load_completed_usernames(tmp_path, monkeypatch):
+def test_load_completed_usernames_legacy_import(tmp_path):
     """
-    Test that load_completed_usernames correctly reads and processes the checkpoint file.
+    Test that load_completed_usernames imports a legacy text checkpoint once and retires it.
     """
-    file_path = tmp_path / "completed_usernames.txt"
-    file_path.write_text("a\nb\n\nc\n")
-    monkeypatch.setattr(user_engagement_metrics, "CHECKPOINT_FILE", str(file_path))
+    legacy_file = tmp_path / "completed_usernames.txt"
+    imported_file = tmp_path / "completed_usernames.txt.imported"
+    legacy_file.write_text("a\nb\n\nc\n")
+    assert user_engagement_metrics.load_completed_usernames() == {"a", "b", "c"}
+    assert not legacy_file.exists()
+    assert imported_file.exists()
+
+    # A second open reads only the database and leaves the retired file alone
+    user_engagement_metrics.close_files()
+    imported_file.write_text("d\n")
     assert user_engagement_metrics.load_completed_usernames() == {"a", "b", "c"}
+    assert not legacy_file.exists()
 
 
-def test_append_completed_username(tmp_path, monkeypatch):
+def test_append_completed_username(tmp_path):
     """
-    Test that append_completed_username correctly writes to the checkpoint file.
+    Test that append_completed_username persists usernames to the checkpoint database.
     """
-    file_path = tmp_path / "completed_usernames.txt"
-    monkeypatch.setattr(user_engagement_metrics, "CHECKPOINT_FILE", str(file_path))
     user_engagement_metrics.append_completed_username("dude")
-    assert file_path.read_text().strip() == "dude"
+    user_engagement_metrics.append_completed_username("dude")
+    user_engagement_metrics.close_files()
+    with closing(sqlite3.connect(tmp_path / "completed_usernames.sqlite")) as conn:
+        rows = conn.execute("SELECT username FROM done").fetchall()
+    assert rows == [("dude",)]
+    assert user_engagement_metrics.load_completed_usernames() == {"dude"}
 
 
 def test_append_result(tmp_path, monkeypatch):
@@ -193,4 +449,240 @@ def test_append_result(tmp_path, monkeypatch):
     file_path = tmp_path / "user_results.jsonl"
     monkeypatch.setattr(user_engagement_metrics, "OUTPUT_FILE", str(file_path))
     user_engagement_metrics.append_result({"foo": "bar"})
-    assert json.loads(file_path.read_text()) == {"foo": "bar"}
+    user_engagement_metrics.flush_files()
+    assert json.loads(file_path.read_bytes()) == {"foo": "bar"}
+
+
+@responses.activate
+def test_fetch_user_graphql():
+    """
+    Test that fetch_user_graphql maps the GraphQL response onto the result fields.
+    """
+    responses.post(
+        f"{API}/graphql",
+        json={
+            "data": {
+                "user": {
+                    "name": "Foo",
+                    "followers": {"totalCount": 10},
+                    "following": {"totalCount": 2},
+                    "repositories": {"totalCount": 3},
+                    "starredRepositories": {"totalCount": 7},
+                    "organizations": {"nodes": [{"login": "acme"}]},
+                    "pullRequests": {"totalCount": 4},
+                    "issues": {"totalCount": 5},
+                }
+            }
+        },
+    )
+    assert user_engagement_metrics.fetch_user_graphql("foo") == {
+        "username": "foo",
+        "name": "Foo",
+        "public_repos": 3,
+        "followers": 10,
+        "following": 2,
+        "organizations": ["acme"],
+        "starred_repos": 7,
+        "total_public_prs": 4,
+        "total_public_issues": 5,
+    }
+    request_body = json.loads(responses.calls[0].request.body)
+    assert request_body["variables"] == {"login": "foo"}
+
+
+@responses.activate
+def test_fetch_user_graphql_not_found():
+    """
+    Test that fetch_user_graphql raises ValueError on NOT_FOUND so REST can decide.
+    """
+    responses.post(
+        f"{API}/graphql",
+        json={
+            "data": {"user": None},
+            "errors": [{"type": "NOT_FOUND", "message": "Could not resolve"}],
+        },
+    )
+    with pytest.raises(ValueError):
+        user_engagement_metrics.fetch_user_graphql("ghost")
+
+
+@responses.activate
+def test_fetch_user_graphql_partial_errors():
+    """
+    Test that fetch_user_graphql raises ValueError when the payload carries errors alongside data.
+    """
+    responses.post(
+        f"{API}/graphql",
+        json={
+            "data": {
+                "user": {
+                    "name": "Foo",
+                    "followers": {"totalCount": 10},
+                    "following": {"totalCount": 2},
+                    "repositories": {"totalCount": 3},
+                    "starredRepositories": {"totalCount": 7},
+                    "organizations": None,
+                    "pullRequests": {"totalCount": 4},
+                    "issues": {"totalCount": 5},
+                }
+            },
+            "errors": [{"type": "FORBIDDEN", "path": ["user", "organizations"]}],
+        },
+    )
+    with pytest.raises(ValueError):
+        user_engagement_metrics.fetch_user_graphql("foo")
+
+
+@responses.activate
+def test_fetch_user_graphql_error():
+    """
+    Test that fetch_user_graphql raises ValueError when the query cannot be answered.
+    """
+    responses.post(f"{API}/graphql", status=401, json={"message": "Bad credentials"})
+    with pytest.raises(ValueError):
+        user_engagement_metrics.fetch_user_graphql("foo")
+
+
+def test_collect_user_metrics(monkeypatch):
+    """
+    Test that collect_user_metrics adds the commit count to the GraphQL metrics.
+    """
+    monkeypatch.setattr(
+        user_engagement_metrics,
+        "fetch_user_graphql",
+        lambda user: {"username": user, "total_public_prs": 4},
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics, "search_user_contributions", lambda user, type_: 6
+    )
+    assert user_engagement_metrics.collect_user_metrics("foo") == {
+        "username": "foo",
+        "total_public_prs": 4,
+        "total_public_commits": 6,
+    }
+
+
+def test_collect_user_metrics_rest_fallback(monkeypatch):
+    """
+    Test that collect_user_metrics falls back to the REST API when GraphQL fails.
+    """
+
+    def fetch_user_graphql(_user):
+        raise ValueError("GraphQL request returned status 502")
+
+    monkeypatch.setattr(
+        user_engagement_metrics, "fetch_user_graphql", fetch_user_graphql
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics,
+        "get_user_profile",
+        lambda user: {
+            "name": "Foo",
+            "public_repos": 3,
+            "followers": 10,
+            "following": 2,
+        },
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics, "get_starred_repos_count", lambda user: 7
+    )
+    monkeypatch.setattr(user_engagement_metrics, "get_orgs", lambda user: ["acme"])
+    counts = {"pr": 4, "issue": 5, "commit": 6}
+    monkeypatch.setattr(
+        user_engagement_metrics,
+        "search_user_contributions",
+        lambda user, type_: counts[type_],
+    )
+    assert user_engagement_metrics.collect_user_metrics("foo") == {
+        "username": "foo",
+        "name": "Foo",
+        "public_repos": 3,
+        "followers": 10,
+        "following": 2,
+        "organizations": ["acme"],
+        "starred_repos": 7,
+        "total_public_prs": 4,
+        "total_public_issues": 5,
+        "total_public_commits": 6,
+    }
+
+
+def test_collect_user_metrics_not_found(monkeypatch):
+    """
+    Test that collect_user_metrics returns None when REST confirms the user does not exist.
+    """
+
+    def fetch_user_graphql(_user):
+        raise ValueError("GraphQL query returned errors: [NOT_FOUND]")
+
+    monkeypatch.setattr(
+        user_engagement_metrics, "fetch_user_graphql", fetch_user_graphql
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics,
+        "get_user_profile",
+        lambda user: {"message": "Not Found"},
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics, "get_starred_repos_count", lambda user: 0
+    )
+    monkeypatch.setattr(user_engagement_metrics, "get_orgs", lambda user: [])
+    monkeypatch.setattr(
+        user_engagement_metrics, "search_user_contributions", lambda user, type_: 0
+    )
+    assert user_engagement_metrics.collect_user_metrics("ghost") is None
+
+
+@responses.activate
+def test_collect_user_metrics_graphql_not_found_rest_profile(monkeypatch):
+    """
+    Test that a login GraphQL cannot resolve, such as an organization, is collected via REST.
+    """
+    responses.post(
+        f"{API}/graphql",
+        json={
+            "data": {"user": None},
+            "errors": [{"type": "NOT_FOUND", "message": "Could not resolve"}],
+        },
+    )
+    responses.get(
+        f"{API}/users/acme",
+        json={"login": "acme", "name": "Acme", "public_repos": 12},
+    )
+    monkeypatch.setattr(
+        user_engagement_metrics, "get_starred_repos_count", lambda user: 0
+    )
+    monkeypatch.setattr(user_engagement_metrics, "get_orgs", lambda user: [])
+    monkeypatch.setattr(
+        user_engagement_metrics, "search_user_contributions", lambda user, type_: 1
+    )
+    result = user_engagement_metrics.collect_user_metrics("acme")
+    assert result["username"] == "acme"
+    assert result["name"] == "Acme"
+    assert result["public_repos"] == 12
+    assert result["total_public_commits"] == 1
+
+
+def test_pending_usernames():
+    """
+    Test that pending_usernames drops completed and duplicate usernames, keeping input order.
+    """
+    assert user_engagement_metrics.pending_usernames(
+        ["c", "a", "b", "c", "a", "d"], {"b"}
+    ) == ["c", "a", "d"]
+
+
+def test_process_users(monkeypatch):
+    """
+    Test that process_users yields a completed future for every username.
+    """
+    monkeypatch.setattr(user_engagement_metrics, "MAX_USER_WORKERS", 2)
+    monkeypatch.setattr(
+        user_engagement_metrics, "collect_user_metrics", lambda user: {"username": user}
+    )
+    usernames = ["a", "b", "c", "d", "e"]
+    results = {
+        username: future.result()
+        for username, future in user_engagement_metrics.process_users(usernames)
+    }
+    assert results == {username: {"username": username} for username in usernames}
@@ -3,99 +3,437 @@ GitHub User Engagement Metrics Collector
 
 This module fetches and aggregates GitHub user engagement metrics for a list of usernames.
 It collects data on repositories, contributions, organizations, and user profiles from the
-GitHub API. The script handles rate limiting, retries, and checkpointing to resume
-interrupted operations.
+GitHub GraphQL API, falling back to the REST API when a GraphQL query cannot be answered.
+The script handles rate limiting, retries, and checkpointing to resume interrupted
+operations.
 
 Usage:
     1. Add GitHub usernames to 'usernames.txt' (one per line)
-    2. Replace 'your_token' with a valid GitHub API token
+    2. Set the GITHUB_TOKEN environment variable to a valid GitHub API token
     3. Run the script to collect metrics
     4. Results are stored in 'user_results.jsonl'
 """
 
+import atexit
 import json
 import os
 import random
+import re
+import sqlite3
+import threading
 import time
-from re import search
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import count, islice
+from operator import itemgetter
+from types import MappingProxyType
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 
-GITHUB_API = "https://api.github.com"
-TOKEN = "your_token"  # Replace with your token for higher limits
+try:
+    import orjson
+
+    def _dumps_line(obj):
+        """Serialize obj as one compact JSONL line of UTF-8 bytes."""
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+except ImportError:  # pragma: no cover
 
-headers = {"Accept": "application/vnd.github+json", "Authorization": f"token {TOKEN}"}
+    def _dumps_line(obj):
+        """Serialize obj as one compact JSONL line of UTF-8 bytes."""
+        return (json.dumps(obj, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+GITHUB_API = "https://api.github.com"
+GRAPHQL_API = f"{GITHUB_API}/graphql"
+ISSUE_SEARCH_URL = f"{GITHUB_API}/search/issues"
+COMMIT_SEARCH_URL = f"{GITHUB_API}/search/commits"
+TOKEN = os.environ.get("GITHUB_TOKEN", "your_token")  # Set for higher limits
+
+# Read-only so the defaults shared by every request cannot be mutated by callers
+headers = MappingProxyType(
+    {"Accept": "application/vnd.github+json", "Authorization": f"token {TOKEN}"}
+)
+
+# Search query prefix per contribution type, prepended to "author:<user>"
+SEARCH_QUALIFIERS = {"pr": "type:pr ", "issue": "type:issue ", "commit": ""}
+COMMIT_SEARCH_HEADERS = MappingProxyType(
+    {"Accept": "application/vnd.github.cloak-preview+json"}
+)
 
 USERNAMES_FILE = "usernames.txt"  # Each line: a github username
 OUTPUT_FILE = "user_results.jsonl"  # One JSON per line
-CHECKPOINT_FILE = "completed_usernames.txt"  # To track finished users
+CHECKPOINT_FILE = "completed_usernames.sqlite"  # To track finished users
+LEGACY_CHECKPOINT_FILE = "completed_usernames.txt"  # Imported into CHECKPOINT_FILE
+ETAG_CACHE_FILE = "etag_cache.sqlite"  # REST responses reused via conditional requests
+ETAG_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # Seconds before a cached response is evicted
+FLUSH_INTERVAL = 16  # Completed users between flushes of the output files
+WRITE_BUFFER_SIZE = 1 << 16
+
+_get_login = itemgetter("login")
+# GitHub puts page last in its Link URLs, which the fast pattern relies on. The
+# anchored pattern handles any parameter order and is only needed when the fast
+# one matched the tail of per_page= instead.
+_LAST_PAGE_RE = re.compile(r'page=(\d+)>;\s*rel="last"')
+_LAST_PAGE_ANY_ORDER_RE = re.compile(r'[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+_OPEN_FILES: dict = {}  # Path -> persistent append handle
+_CHECKPOINT_DBS: dict = {}  # Path -> sqlite3 connection
+_COMPLETED_COUNTER = count(1)
+
+_ETAG_CACHES: dict = {}  # Path -> sqlite3 connection
+_ETAG_CACHE_LOCK = threading.Lock()
+CACHED_RESPONSE_HEADERS = ("Link",)  # Headers callers read from cached responses
+LOOKUP_CACHE_SIZE = 4096  # Users whose profile and orgs are memoized per run
+# Profile fields used in the results, plus "message" for API errors
+PROFILE_FIELDS = ("name", "public_repos", "followers", "following", "message")
+
+PROGRESS_INTERVAL = 25  # Completed users between progress messages
+
+MAX_USER_WORKERS = 8  # Users processed concurrently
+MAX_REQUEST_WORKERS = 6  # Concurrent API calls per user
+# Primary rate limits reset hourly; a longer wait means a bogus or skewed reset time.
+MAX_RATE_LIMIT_SLEEP = 65 * 60
+# Below this many remaining calls (or a tenth of a smaller bucket's limit),
+# requests are paced to last until the reset
+RATE_LIMIT_LOW_WATERMARK = 100
+_THROTTLE_LOCKS: dict = {}  # X-RateLimit-Resource -> lock serializing its pacing
+
+# Shared session so keep-alive connections are reused across calls and threads.
+# The pool is sized for every request that can be in flight at once.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=MAX_USER_WORKERS * MAX_REQUEST_WORKERS,
+        pool_maxsize=MAX_USER_WORKERS * MAX_REQUEST_WORKERS,
+        max_retries=0,
+    ),
+)
+SESSION.headers.update(headers)
+
+
+# Everything except commit counts in a single round trip. Commits stay on REST
+# search because contributionsCollection only covers the last year.
+USER_METRICS_QUERY = """
+query($login: String!) {
+  user(login: $login) {
+    name
+    followers { totalCount }
+    following { totalCount }
+    repositories(ownerAffiliations: OWNER, privacy: PUBLIC) { totalCount }
+    starredRepositories { totalCount }
+    organizations(first: 100) { nodes { login } }
+    pullRequests { totalCount }
+    issues { totalCount }
+  }
+}
+"""
 
 
-def safe_get(url, params=None, extra_headers=None, max_retries=5):
+class RateLimitExceeded(requests.RequestException):
     """
-    Make a GET request to the GitHub API with automatic rate limit handling and retries.
+    Raised when the rate limit reset is further away than MAX_RATE_LIMIT_SLEEP.
+    """
+
+
+def _etag_cache():
+    """Return the ETag cache connection, creating the database on first use."""
+    if ETAG_CACHE_FILE not in _ETAG_CACHES:
+        connection = sqlite3.connect(ETAG_CACHE_FILE, check_same_thread=False)
+        # WAL with NORMAL sync keeps per-response commits off the fsync path;
+        # losing the last few entries in a crash only costs a refetch.
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, etag TEXT NOT NULL, headers TEXT NOT NULL, "
+            "body BLOB NOT NULL, last_seen REAL NOT NULL)"
+        )
+        connection.execute(
+            "DELETE FROM responses WHERE last_seen < ?",
+            (time.time() - ETAG_CACHE_MAX_AGE,),
+        )
+        connection.commit()
+        _ETAG_CACHES[ETAG_CACHE_FILE] = connection
+    return _ETAG_CACHES[ETAG_CACHE_FILE]
+
+
+def _etag_cache_key(method, url, params, extra_headers):
+    """Build a canonical cache key for a request."""
+    return json.dumps(
+        [
+            method,
+            url,
+            sorted((params or {}).items()),
+            sorted((extra_headers or {}).items()),
+        ]
+    )
+
+
+def load_cached_response(cache_key):
+    """
+    Look up a previously cached response.
+
+    Args:
+        cache_key (str): The canonical key of the request
+
+    Returns:
+        tuple: (etag, headers, body) of the cached response, or None if there is none
+    """
+    with _ETAG_CACHE_LOCK:
+        row = (
+            _etag_cache()
+            .execute(
+                "SELECT etag, headers, body FROM responses WHERE key = ?", (cache_key,)
+            )
+            .fetchone()
+        )
+    if row is None:
+        return None
+    etag, cached_headers, body = row
+    return etag, json.loads(cached_headers), body
+
+
+def store_cached_response(cache_key, response):
+    """
+    Cache a response that carries an ETag so later runs can revalidate it.
+
+    Args:
+        cache_key (str): The canonical key of the request
+        response (requests.Response): The successful response to cache
+    """
+    cached_headers = {
+        name: response.headers[name]
+        for name in CACHED_RESPONSE_HEADERS
+        if name in response.headers
+    }
+    with _ETAG_CACHE_LOCK:
+        connection = _etag_cache()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (
+                cache_key,
+                response.headers["ETag"],
+                json.dumps(cached_headers),
+                response.content,
+                time.time(),
+            ),
+        )
+        connection.commit()
+
+
+def close_etag_cache():
+    """
+    Close every open ETag cache connection.
+    """
+    with _ETAG_CACHE_LOCK:
+        for connection in _ETAG_CACHES.values():
+            connection.close()
+        _ETAG_CACHES.clear()
+
+
+atexit.register(close_etag_cache)
+
+
+def _cached_response(cached_headers, body):
+    """Build a 200 response object from a cached body and headers."""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(cached_headers)
+    response._content = body  # pylint: disable=protected-access
+    response.encoding = "utf-8"
+    return response
+
+
+def _pace_rate_limit(response):
+    """Spread the remaining budget of the response's rate limit bucket until reset."""
+    remaining = int(response.headers.get("X-RateLimit-Remaining", -1))
+    limit = int(
+        response.headers.get("X-RateLimit-Limit", RATE_LIMIT_LOW_WATERMARK * 10)
+    )
+    if 0 < remaining < min(RATE_LIMIT_LOW_WATERMARK, limit // 10):
+        reset_time = int(response.headers.get("X-RateLimit-Reset", time.time()))
+        pause = min(max(reset_time - time.time(), 0) / remaining, MAX_RATE_LIMIT_SLEEP)
+        # Serialized per bucket so concurrent workers share its paced budget
+        # without stalling requests that draw on other buckets
+        resource = response.headers.get("X-RateLimit-Resource", "core")
+        with _THROTTLE_LOCKS.setdefault(resource, threading.Lock()):
+            time.sleep(pause)
+
+
+def safe_request(
+    method,
+    url,
+    *,
+    params=None,
+    json_body=None,
+    extra_headers=None,
+    max_retries=5,
+    use_cache=False,
+):
+    """
+    Make a request to the GitHub API with automatic rate limit handling and retries.
 
-    This function handles rate limits by sleeping until the reset time when limits are hit.
-    It also implements exponential backoff for server errors.
+    This function handles rate limits by sleeping until the reset time when limits are hit,
+    or for as long as a Retry-After header asks on secondary rate limits. A small random
+    jitter is added to those sleeps so concurrent workers do not all retry at the same
+    instant. When few calls remain, requests are paced so the remaining budget lasts
+    until the reset. It also implements exponential backoff for server errors.
+    Requests go through the shared SESSION so connections to the API are kept alive
+    and reused.
+
+    With use_cache, a cached ETag is sent as If-None-Match and a 304 Not Modified
+    answer, which does not count against the rate limit, is served from the cache.
 
     Args:
+        method (str): The HTTP method to use, e.g. "GET" or "POST"
         url (str): The API endpoint URL to request
         params (dict, optional): Query parameters for the request. Defaults to None.
+        json_body (dict, optional): JSON payload to send as the request body.
+                                    Defaults to None.
         extra_headers (dict, optional): Additional headers to include in the request.
                                         Defaults to None.
         max_retries (int, optional): Maximum number of retry attempts for failed requests.
                                      Defaults to 5.
+        use_cache (bool, optional): Revalidate against and update the ETag cache.
+                                    Defaults to False.
 
     Returns:
         requests.Response: The response object from the successful request
+
+    Raises:
+        RateLimitExceeded: If the rate limit resets, or Retry-After asks to wait, more
+                           than MAX_RATE_LIMIT_SLEEP seconds from now
     """
+    request_headers = extra_headers
+    cache_key = cached = None
+    if use_cache:
+        cache_key = _etag_cache_key(method, url, params, extra_headers)
+        cached = load_cached_response(cache_key)
+        if cached:
+            request_headers = {**(extra_headers or {}), "If-None-Match": cached[0]}
     retries = 0
     while True:
-        combined_headers = headers.copy()
-        if extra_headers:
-            combined_headers.update(extra_headers)
-        response = requests.get(
-            url, headers=combined_headers, params=params, timeout=10
+        response = SESSION.request(
+            method,
+            url,
+            headers=request_headers or None,
+            params=params,
+            json=json_body,
+            timeout=10,
         )
-        if response.status_code == 403:
+        if response.status_code == 304 and cached:
+            return _cached_response(cached[1], cached[2])
+        retry_after = response.headers.get("Retry-After", "")
+        if (
+            response.status_code in (403, 429)
+            and retry_after.isdigit()
+            and retries < max_retries
+        ):
+            # Secondary rate limits say how long to wait and leave the primary
+            # remaining count above zero. Non-numeric values (HTTP dates) fall
+            # through to the exponential backoff below.
+            sleep_for = int(retry_after) + 1
+            if sleep_for > MAX_RATE_LIMIT_SLEEP:
+                raise RateLimitExceeded(
+                    f"Secondary rate limit for {url} lifts in {sleep_for/60:.2f} minutes."
+                )
+            print(f"Secondary rate limit hit. Retrying in {sleep_for} seconds...")
+            time.sleep(sleep_for + random.uniform(0, 1))
+            retries += 1
+            continue
+        if response.status_code in (403, 429):
             remaining = int(response.headers.get("X-RateLimit-Remaining", "1"))
             if remaining == 0:
                 reset_time = int(
                     response.headers.get("X-RateLimit-Reset", time.time() + 60)
                 )
-                sleep_for = max(reset_time - time.time(), 0) + 2
+                # The reset header is a wall-clock epoch, so the clock is read once to
+                # turn it into a duration; time.sleep itself is monotonic.
+                sleep_for = max(reset_time - time.time(), 0) + 2 + random.uniform(0, 1)
+                if sleep_for > MAX_RATE_LIMIT_SLEEP:
+                    raise RateLimitExceeded(
+                        f"Rate limit for {url} resets in {sleep_for/60:.2f} minutes."
+                    )
                 print(
                     f"Rate limit hit. Sleeping for {sleep_for/60:.2f} minutes (until reset)."
                 )
                 time.sleep(sleep_for)
                 retries = 0
                 continue
-        if response.status_code in (500, 502, 503, 504) or response.status_code == 403:
+        if response.status_code in (403, 429, 500, 502, 503, 504):
             if retries < max_retries:
-                wait = (2**retries) + random.uniform(0, 1)
+                backoff = (2**retries) + random.uniform(0, 1)
                 print(
-                    f"Error {response.status_code} on {url}. Retrying in {wait:.2f} seconds..."
+                    f"Error {response.status_code} on {url}. Retrying in {backoff:.2f} seconds..."
                 )
-                time.sleep(wait)
+                time.sleep(backoff)
                 retries += 1
                 continue
             print(f"Max retries reached for {url}. Skipping.")
             return response
+        if use_cache and response.status_code == 200 and "ETag" in response.headers:
+            store_cached_response(cache_key, response)
+        _pace_rate_limit(response)
         return response
 
 
+def safe_get(url, params=None, extra_headers=None, max_retries=5, use_cache=False):
+    """
+    Make a GET request to the GitHub API with automatic rate limit handling and retries.
+
+    Args:
+        url (str): The API endpoint URL to request
+        params (dict, optional): Query parameters for the request. Defaults to None.
+        extra_headers (dict, optional): Additional headers to include in the request.
+                                        Defaults to None.
+        max_retries (int, optional): Maximum number of retry attempts for failed requests.
+                                     Defaults to 5.
+        use_cache (bool, optional): Revalidate against and update the ETag cache.
+                                    Defaults to False.
+
+    Returns:
+        requests.Response: The response object from the successful request
+    """
+    return safe_request(
+        "GET",
+        url,
+        params=params,
+        extra_headers=extra_headers,
+        max_retries=max_retries,
+        use_cache=use_cache,
+    )
+
+
+@lru_cache(maxsize=LOOKUP_CACHE_SIZE)
 def get_user_profile(user):
     """
     Fetch a GitHub user's profile information.
 
+    Only the fields listed in PROFILE_FIELDS are kept. Profiles and Not Found
+    answers are memoized for the rest of the run, so the returned dict must not
+    be modified. Other errors raise and are therefore never memoized.
+
     Args:
         user (str): The GitHub username to fetch profile for
 
     Returns:
         dict: User profile data from the GitHub API
+
+    Raises:
+        ValueError: If the API answers with an error other than Not Found
     """
     url = f"{GITHUB_API}/users/{user}"
-    return safe_get(url).json()
+    response = safe_get(url, use_cache=True)
+    if response.status_code not in (200, 404):
+        raise ValueError(
+            f"Profile request for {user} returned status {response.status_code}"
+        )
+    profile = response.json()
+    return {field: profile[field] for field in PROFILE_FIELDS if field in profile}
 
 
 def get_user_repos(user_name):
@@ -105,6 +443,9 @@ def get_user_repos(user_name):
     This function handles pagination to retrieve all repositories even if
     the user has more than 100 repos (the API's default page size).
 
+    It is not part of the metrics collection, which only needs the repository
+    count from the user's profile, and is kept for callers that need the listing.
+
     Args:
         user_name (str): The GitHub username to fetch repositories for
 
@@ -116,7 +457,7 @@ def get_user_repos(user_name):
     while True:
         url = f"{GITHUB_API}/users/{user_name}/repos"
         params = {"per_page": 100, "page": page}
-        res = safe_get(url, params=params).json()
+        res = safe_get(url, params=params, use_cache=True).json()
         if not res or "message" in res:
             break
         repositories.extend(res)
@@ -131,7 +472,9 @@ def get_starred_repos_count(user):
     Get the total count of repositories starred by a GitHub user.
 
     This function efficiently determines the count by examining the pagination
-    links rather than fetching all starred repos.
+    links of a HEAD request rather than fetching all starred repos. Only users
+    with at most one starred repo have no pagination links, in which case the
+    single page is fetched and counted.
 
     Args:
         user (str): The GitHub username to check
@@ -141,27 +484,81 @@ def get_starred_repos_count(user):
     """
     url = f"{GITHUB_API}/users/{user}/starred"
     params = {"per_page": 1}
-    res = safe_get(url, params=params)
+    res = safe_request("HEAD", url, params=params, use_cache=True)
     link = res.headers.get("Link", "")
     if 'rel="last"' in link:
-        match = search(r'page=(\d+)>; rel="last"', link)
+        match = _LAST_PAGE_RE.search(link)
+        if match and link[match.start() - 1] == "_":
+            match = _LAST_PAGE_ANY_ORDER_RE.search(link)
         if match:
             return int(match.group(1))
-    return len(res.json())
+    return len(safe_get(url, params=params, use_cache=True).json())
 
 
+@lru_cache(maxsize=LOOKUP_CACHE_SIZE)
 def get_orgs(user):
     """
-    Fetch all organizations a GitHub user is a member of.
+    Fetch the logins of all organizations a GitHub user is a member of.
+
+    Results are memoized for the rest of the run, so the returned list must not
+    be modified.
 
     Args:
         user (str): The GitHub username to check
 
     Returns:
-        list: A list of organization objects from the GitHub API
+        list: A list of organization logins
+
+    Raises:
+        ValueError: If the API returns an error instead of a list of organizations
     """
     url = f"{GITHUB_API}/users/{user}/orgs"
-    return safe_get(url).json()
+    orgs = safe_get(url, use_cache=True).json()
+    if not isinstance(orgs, list):
+        raise ValueError(f"Unexpected organizations response for {user}: {orgs}")
+    return list(map(_get_login, orgs))
+
+
+def fetch_user_graphql(user):
+    """
+    Fetch a user's profile, starred, organization, pull request and issue metrics
+    with a single GitHub GraphQL query.
+
+    Args:
+        user (str): The GitHub username to fetch metrics for
+
+    Returns:
+        dict: The user's engagement metrics excluding commits
+
+    Raises:
+        ValueError: If the query fails or returns any errors, including NOT_FOUND
+    """
+    response = safe_request(
+        "POST",
+        GRAPHQL_API,
+        json_body={"query": USER_METRICS_QUERY, "variables": {"login": user}},
+    )
+    if response.status_code != 200:
+        raise ValueError(f"GraphQL request returned status {response.status_code}")
+    payload = response.json()
+    node = (payload.get("data") or {}).get("user")
+    errors = payload.get("errors") or []
+    # NOT_FOUND is also returned for organization logins, which REST resolves,
+    # and partial data (e.g. organizations hidden behind SAML) is incomplete,
+    # so both are left to the REST fallback.
+    if errors or node is None:
+        raise ValueError(f"GraphQL query returned errors: {errors}")
+    return {
+        "username": user,
+        "name": node["name"],
+        "public_repos": node["repositories"]["totalCount"],
+        "followers": node["followers"]["totalCount"],
+        "following": node["following"]["totalCount"],
+        "organizations": list(map(_get_login, node["organizations"]["nodes"])),
+        "starred_repos": node["starredRepositories"]["totalCount"],
+        "total_public_prs": node["pullRequests"]["totalCount"],
+        "total_public_issues": node["issues"]["totalCount"],
+    }
 
 
 def search_user_contributions(user, type_):
@@ -176,57 +573,234 @@ def search_user_contributions(user, type_):
     Returns:
         int: The total count of contributions of the specified type
     """
-    q_map = {
-        "pr": f"type:pr author:{user}",
-        "issue": f"type:issue author:{user}",
-        "commit": f"author:{user}",
-    }
+    q = f"{SEARCH_QUALIFIERS[type_]}author:{user}"
     if type_ == "commit":
-        url = f"{GITHUB_API}/search/commits"
-        extra_headers = {"Accept": "application/vnd.github.cloak-preview+json"}
-        r = safe_get(url, params={"q": q_map[type_]}, extra_headers=extra_headers)
+        r = safe_get(
+            COMMIT_SEARCH_URL, params={"q": q}, extra_headers=COMMIT_SEARCH_HEADERS
+        )
     else:
-        url = f"{GITHUB_API}/search/issues"
-        r = safe_get(url, params={"q": q_map[type_]})
+        r = safe_get(ISSUE_SEARCH_URL, params={"q": q})
     return r.json().get("total_count", 0)
 
 
+def _checkpoint_db():
+    """Return the checkpoint database connection, creating it on first use."""
+    if CHECKPOINT_FILE not in _CHECKPOINT_DBS:
+        connection = sqlite3.connect(CHECKPOINT_FILE)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS done (username TEXT PRIMARY KEY)"
+        )
+        if os.path.exists(LEGACY_CHECKPOINT_FILE):
+            with open(LEGACY_CHECKPOINT_FILE, "rb") as legacy_checkpoint:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO done VALUES (?)",
+                    ((u,) for u in legacy_checkpoint.read().decode("utf-8").split()),
+                )
+            connection.commit()
+            # Retire the text file so later runs do not import it again
+            os.replace(LEGACY_CHECKPOINT_FILE, LEGACY_CHECKPOINT_FILE + ".imported")
+        _CHECKPOINT_DBS[CHECKPOINT_FILE] = connection
+    return _CHECKPOINT_DBS[CHECKPOINT_FILE]
+
+
 def load_completed_usernames():
     """
     Load the set of usernames that have already been processed.
 
-    This function reads the checkpoint file to determine which users
-    have been successfully processed in previous runs.
+    This function reads the checkpoint database to determine which users
+    have been successfully processed in previous runs. Usernames from a
+    text checkpoint written by older versions are imported once, after which
+    the text file is renamed with an ".imported" suffix.
 
     Returns:
         set: A set of usernames that have already been processed
     """
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as checkpoint_file_load:
-            return set(line.strip() for line in checkpoint_file_load if line.strip())
-    return set()
+    return {row[0] for row in _checkpoint_db().execute("SELECT username FROM done")}
+
+
+def _append_handle(path):
+    """Return the persistent buffered append handle for path, opening it on first use."""
+    if path not in _OPEN_FILES:
+        _OPEN_FILES[path] = open(  # pylint: disable=consider-using-with
+            path, "ab", buffering=WRITE_BUFFER_SIZE
+        )
+    return _OPEN_FILES[path]
+
+
+def flush_files():
+    """
+    Flush buffered output writes to disk and commit pending checkpoints.
+
+    The output file is synced before the checkpoint is committed so a user is
+    never marked as completed without their result having been saved.
+    """
+    if OUTPUT_FILE in _OPEN_FILES:
+        _OPEN_FILES[OUTPUT_FILE].flush()
+        os.fsync(_OPEN_FILES[OUTPUT_FILE].fileno())
+    if CHECKPOINT_FILE in _CHECKPOINT_DBS:
+        _CHECKPOINT_DBS[CHECKPOINT_FILE].commit()
+
+
+def close_files():
+    """
+    Flush and close every file handle and database opened by the append functions.
+    """
+    flush_files()
+    for file_handle in _OPEN_FILES.values():
+        file_handle.close()
+    _OPEN_FILES.clear()
+    for connection in _CHECKPOINT_DBS.values():
+        connection.close()
+    _CHECKPOINT_DBS.clear()
+
+
+atexit.register(close_files)
 
 
 def append_completed_username(completed_username):
     """
-    Mark a username as completed by adding it to the checkpoint file.
+    Mark a username as completed by adding it to the checkpoint database.
+
+    Inserts are committed in batches every FLUSH_INTERVAL users.
 
     Args:
         completed_username (str): The GitHub username to mark as completed
     """
-    with open(CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint_file_append:
-        checkpoint_file_append.write(completed_username + "\n")
+    _checkpoint_db().execute(
+        "INSERT OR IGNORE INTO done VALUES (?)", (completed_username,)
+    )
+    if next(_COMPLETED_COUNTER) % FLUSH_INTERVAL == 0:
+        flush_files()
 
 
 def append_result(user_result):
     """
     Append a user's engagement metrics to the output file.
 
+    Rows are serialized with orjson when it is installed. Writes are buffered
+    and flushed along with the checkpoint file.
+
     Args:
         user_result (dict): The user's engagement metrics to save
     """
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as output_file_append:
-        output_file_append.write(json.dumps(user_result) + "\n")
+    _append_handle(OUTPUT_FILE).write(_dumps_line(user_result))
+
+
+def collect_user_metrics_rest(user, executor):
+    """
+    Collect a user's engagement metrics, excluding commits, from the REST API.
+
+    The independent REST calls for the user are submitted to the given executor
+    so they run concurrently.
+
+    Args:
+        user (str): The GitHub username to collect metrics for
+        executor (ThreadPoolExecutor): The executor to submit the API calls to
+
+    Returns:
+        dict: The user's engagement metrics excluding commits, or None if the
+              user does not exist
+    """
+    profile_future = executor.submit(get_user_profile, user)
+    starred_future = executor.submit(get_starred_repos_count, user)
+    orgs_future = executor.submit(get_orgs, user)
+    pr_future = executor.submit(search_user_contributions, user, "pr")
+    issue_future = executor.submit(search_user_contributions, user, "issue")
+
+    profile = profile_future.result()
+    if "message" in profile and profile["message"] == "Not Found":
+        return None
+
+    return {
+        "username": user,
+        "name": profile.get("name"),
+        "public_repos": profile.get("public_repos"),
+        "followers": profile.get("followers"),
+        "following": profile.get("following"),
+        "organizations": orgs_future.result(),
+        "starred_repos": starred_future.result(),
+        "total_public_prs": pr_future.result(),
+        "total_public_issues": issue_future.result(),
+    }
+
+
+def collect_user_metrics(user):
+    """
+    Collect all engagement metrics for a single GitHub user.
+
+    Most metrics come from one GraphQL query, with the REST API used as a
+    fallback when that query fails. Whether a login exists is decided by the
+    REST profile lookup, since GraphQL cannot resolve organization logins. The commit search runs concurrently with
+    either path so the user costs roughly one round trip.
+
+    Args:
+        user (str): The GitHub username to collect metrics for
+
+    Returns:
+        dict: The user's engagement metrics, or None if the user does not exist
+    """
+    with ThreadPoolExecutor(max_workers=MAX_REQUEST_WORKERS) as executor:
+        commit_future = executor.submit(search_user_contributions, user, "commit")
+        try:
+            metrics = fetch_user_graphql(user)
+        except ValueError as e:
+            print(f"GraphQL query failed for {user}: {e}. Falling back to REST.")
+            metrics = collect_user_metrics_rest(user, executor)
+        if metrics is None:
+            return None
+        metrics["total_public_commits"] = commit_future.result()
+        return metrics
+
+
+def pending_usernames(all_usernames, completed_usernames):
+    """
+    Determine which usernames still need to be processed.
+
+    Args:
+        all_usernames (list): Usernames from the input file, possibly with duplicates
+        completed_usernames (set): Usernames that have already been processed
+
+    Returns:
+        list: The unprocessed usernames, deduplicated and in input order
+    """
+    return [
+        username
+        for username in dict.fromkeys(all_usernames)
+        if username not in completed_usernames
+    ]
+
+
+def process_users(users):
+    """
+    Collect metrics for many users concurrently.
+
+    At most MAX_USER_WORKERS users are in flight at any time and a new user is
+    submitted each time one finishes, so the number of outstanding futures stays
+    bounded no matter how long the username list is.
+
+    Args:
+        users (iterable): The GitHub usernames to collect metrics for
+
+    Yields:
+        tuple: (username, future) for each user, in order of completion
+    """
+    remaining = iter(users)
+    with ThreadPoolExecutor(max_workers=MAX_USER_WORKERS) as executor:
+        in_flight = {
+            executor.submit(collect_user_metrics, user): user
+            for user in islice(remaining, MAX_USER_WORKERS)
+        }
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for user_future in done:
+                user = in_flight.pop(user_future)
+                next_user = next(remaining, None)
+                if next_user is not None:
+                    in_flight[executor.submit(collect_user_metrics, next_user)] = (
+                        next_user
+                    )
+                yield user, user_future
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -236,42 +810,25 @@ if __name__ == "__main__":  # pragma: no cover
 
     print(f"Loaded {len(usernames)} usernames, {len(completed)} already completed.")
     if TOKEN == "your_token":
-        print("Warning: You need to generate and use a token.")
+        print("Warning: You need to generate a token and set GITHUB_TOKEN.")
 
-    for idx, username in enumerate(usernames):
-        if username in completed:
-            continue
-        print(f"Processing {username} ({idx+1}/{len(usernames)})...")
+    pending = pending_usernames(usernames, completed)
+    for idx, (username, future) in enumerate(process_users(pending), start=1):
+        if idx % PROGRESS_INTERVAL == 0 or idx == len(pending):
+            print(f"Processed {idx}/{len(pending)} users...")
         try:
-            profile = get_user_profile(username)
-            if "message" in profile and profile["message"] == "Not Found":
-                print(f"User {username} not found.")
-                append_completed_username(username)
-                continue
-            repos = get_user_repos(username)
-            starred_count = get_starred_repos_count(username)
-            orgs = get_orgs(username)
-            pr_count = search_user_contributions(username, "pr")
-            issue_count = search_user_contributions(username, "issue")
-            commit_count = search_user_contributions(username, "commit")
-
-            result = {
-                "username": username,
-                "name": profile.get("name"),
-                "public_repos": profile.get("public_repos"),
-                "followers": profile.get("followers"),
-                "following": profile.get("following"),
-                "organizations": [org["login"] for org in orgs],
-                "starred_repos": starred_count,
-                "total_public_prs": pr_count,
-                "total_public_issues": issue_count,
-                "total_public_commits": commit_count,
-            }
-            append_result(result)
+            result = future.result()
+        except RateLimitExceeded as e:
+            print(f"Rate limit exceeded processing {username}: {e}")
+            continue
         except requests.RequestException as e:
             print(f"Network error processing {username}: {e}")
             continue
         except (KeyError, ValueError) as e:
             print(f"Data error processing {username}: {e}")
             continue
+        if result is None:
+            print(f"User {username} not found.")
+        else:
+            append_result(result)
         append_completed_username(username)